@@ -2,9 +2,7 @@ import click
 from rich.console import Console
 from rich.table import Table
 
-from . import engine
-from . import notebook as nb
-
+# engine and notebook pull in duckdb/pandas/nbformat, so commands import them on demand.
 
 console = Console()
 
@@ -24,6 +22,8 @@ def version():
 @click.argument("path", type=click.Path(exists=True))
 def add_cmd(name, path):
     """Add a dataset to the catalog."""
+    from . import engine
+
     try:
         engine.add_dataset(name, path)
         console.print(f":white_check_mark: Added [bold]{name}[/bold] -> {path}")
@@ -35,6 +35,8 @@ def add_cmd(name, path):
 @cli.command("ls")
 def ls_cmd():
     """List cataloged datasets."""
+    from . import engine
+
     rows = engine.list_datasets()
     if not rows:
         console.print("No datasets. Add one with: datapulse add <name> <path>")
@@ -51,13 +53,14 @@ def ls_cmd():
 @cli.command("head")
 @click.argument("name")
 @click.option("--table", default=None, help="For SQLite DBs, a specific table to preview.")
-@click.option("--limit", default=5, show_default=True, type=int)
+@click.option("--limit", default=5, show_default=True, type=click.IntRange(min=1))
 def head_cmd(name, table, limit):
     """Preview the top rows of a dataset."""
+    from . import engine
+
     try:
         df = engine.load_df(name, table=table, limit=limit)
-        # Pretty print small tables
-        console.print(df)
+        console.print(engine.render_table(df, max_rows=limit))
     except Exception as e:
         console.print(f":x: [red]{e}[/red]")
         raise SystemExit(1)
@@ -65,15 +68,27 @@ def head_cmd(name, table, limit):
 
 @cli.command("sql")
 @click.argument("query", nargs=-1)
-def sql_cmd(query):
+@click.option(
+    "--materialize/--no-materialize",
+    default=True,
+    show_default=True,
+    help="Load small CSV/Parquet files into in-memory tables instead of views.",
+)
+@click.option(
+    "--max-rows", default=20, show_default=True, type=click.IntRange(min=1), help="Rows of the result to display."
+)
+def sql_cmd(query, materialize, max_rows):
     """Run a SQL query across all cataloged datasets (DuckDB in-memory)."""
+    from . import engine
+
     sql = " ".join(query).strip()
     if not sql:
         console.print(":warning: Provide a query, e.g.: datapulse sql \"SELECT COUNT(*) FROM sales\"")
         raise SystemExit(2)
     try:
-        df = engine.run_sql(sql)
-        console.print(df)
+        rel = engine.sql_relation(sql, materialize=materialize)
+        if rel is not None:
+            console.print(engine.render_table(rel, max_rows=max_rows))
     except Exception as e:
         console.print(f":x: [red]{e}[/red]")
         raise SystemExit(1)
@@ -84,6 +99,8 @@ def sql_cmd(query):
 @click.option("--out", "out_path", default="notebooks/analysis.ipynb", show_default=True)
 def notebook_cmd(sql_text, out_path):
     """Generate a reproducible Jupyter notebook for a SQL query."""
+    from . import notebook as nb
+
     try:
         out = nb.write_notebook_from_sql(sql_text, out_path=out_path)
         console.print(f":white_check_mark: Notebook written to [bold]{out}[/bold]")
@@ -1,41 +1,105 @@
 from __future__ import annotations
-import json
+import bisect
 import os
 import pathlib
-from typing import Dict, List, Optional
+import re
+import urllib.parse
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
 
-import duckdb
-import pandas as pd
+import orjson
+
+# duckdb, pandas, pyarrow and connectorx are imported inside the functions that
+# need them so catalog-only commands (`version`, `ls`, `add`) start quickly.
+if TYPE_CHECKING:
+    import duckdb
+    import pandas as pd
+    import pyarrow as pa
+    from rich.table import Table
 
 CATALOG_DIR = pathlib.Path(".datapulse")
 CATALOG_FILE = CATALOG_DIR / "catalog.json"
 
 SUPPORTED_EXTS = {".csv", ".parquet", ".pq", ".sqlite", ".db"}
 
+# Files below this size are loaded into DuckDB tables once instead of being
+# re-read through a view on every query.
+SMALL_FILE_BYTES = 64 * 1024 * 1024
+
 def _quote_ident(name: str) -> str:
     return '"' + name.replace('"', '""') + '"'
 
 
+def _quote_literal(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
 def _ensure_catalog_dir() -> None:
     CATALOG_DIR.mkdir(parents=True, exist_ok=True)
 
 
+# ((path, st_mtime_ns, st_size), catalog) for the last catalog file parsed.
+_CACHE: Optional[Tuple[tuple, Dict[str, dict]]] = None
+
+
+def _parse_catalog(data: dict) -> Dict[str, dict]:
+    """
+    Convert the on-disk catalog into a name -> {path, format} dict in file order.
+    Files are stored as {"entries": [{name, path, format}, ...]} kept sorted by name;
+    the older {name: {path, format}} layout is still read and is rewritten on the next save.
+    """
+    if isinstance(data.get("entries"), list):
+        return {e["name"]: {"path": e["path"], "format": e["format"]} for e in data["entries"]}
+    return dict(sorted(data.items()))
+
+
 def _load_catalog() -> Dict[str, dict]:
-    _ensure_catalog_dir()
-    if not CATALOG_FILE.exists():
+    """
+    Return the parsed catalog, reusing the previous parse while the file is unchanged.
+    The returned dict is shared; copy it before mutating.
+    """
+    global _CACHE
+    path = os.path.abspath(CATALOG_FILE)
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        _ensure_catalog_dir()
         return {}
-    with CATALOG_FILE.open("r", encoding="utf-8") as f:
-        return json.load(f)
+    key = (path, st.st_mtime_ns, st.st_size)
+    if _CACHE is not None and _CACHE[0] == key:
+        return _CACHE[1]
+    with open(path, "rb") as f:
+        catalog = _parse_catalog(orjson.loads(f.read()))
+    _CACHE = (key, catalog)
+    return catalog
 
 
 def _save_catalog(catalog: Dict[str, dict]) -> None:
+    """Write `catalog`, which must already be ordered by name (see `_insert_sorted`)."""
+    global _CACHE
     _ensure_catalog_dir()
-    with CATALOG_FILE.open("w", encoding="utf-8") as f:
-        json.dump(catalog, f, indent=2, sort_keys=True)
+    data = {"entries": [{"name": k, **v} for k, v in catalog.items()]}
+    # Write beside the catalog and rename over it, so readers never see a partial file.
+    tmp = CATALOG_FILE.with_suffix(".json.tmp")
+    tmp.write_bytes(orjson.dumps(data, option=orjson.OPT_INDENT_2))
+    os.replace(tmp, CATALOG_FILE)
+    path = os.path.abspath(CATALOG_FILE)
+    st = os.stat(path)
+    _CACHE = ((path, st.st_mtime_ns, st.st_size), catalog)
+
+
+def _insert_sorted(catalog: Dict[str, dict], name: str, entry: dict) -> Dict[str, dict]:
+    """Return a copy of `catalog` with `name` set to `entry`, keeping keys in sorted order."""
+    if name in catalog:
+        return {**catalog, name: entry}
+    names = list(catalog)
+    i = bisect.bisect_left(names, name)
+    items = list(catalog.items())
+    items.insert(i, (name, entry))
+    return dict(items)
 
 
 def _infer_format(path: str) -> str:
-    ext = pathlib.Path(path).suffix.lower()
+    ext = os.path.splitext(path)[1].lower()
     if ext in {".pq"}:
         ext = ".parquet"
     if ext not in SUPPORTED_EXTS:
@@ -43,25 +107,45 @@ def _infer_format(path: str) -> str:
     return ext.lstrip(".")
 
 
+def _make_entry(path: str) -> dict:
+    p = os.path.realpath(os.path.expanduser(path))
+    if not os.path.isfile(p):
+        raise FileNotFoundError(f"File not found: {p}")
+    return {"path": p, "format": _infer_format(p)}
+
+
 def add_dataset(name: str, path: str) -> None:
     """Register a local file under a logical name."""
-    p = pathlib.Path(path).expanduser().resolve()
-    if not p.exists():
-        raise FileNotFoundError(f"File not found: {p}")
-    fmt = _infer_format(str(p))
+    entry = _make_entry(path)
     catalog = _load_catalog()
-    catalog[name] = {"path": str(p), "format": fmt}
-    _save_catalog(catalog)
+    if catalog.get(name) == entry:
+        # Re-adding an unchanged entry skips the rewrite, which would also
+        # invalidate the cached DuckDB connection.
+        return
+    _save_catalog(_insert_sorted(catalog, name, entry))
+
+
+def add_datasets(items: List[Tuple[str, str]]) -> None:
+    """
+    Register several (name, path) pairs with a single catalog write.
+    Every path is validated before anything is saved; later pairs win on duplicate names.
+    """
+    entries = {name: _make_entry(path) for name, path in items}
+    catalog = _load_catalog()
+    changed = {k: v for k, v in entries.items() if catalog.get(k) != v}
+    if not changed:
+        return
+    _save_catalog(dict(sorted({**catalog, **changed}.items())))
 
 
 def list_datasets() -> List[dict]:
     """Return catalog entries as a list of dicts: {name, path, format}."""
     catalog = _load_catalog()
-    return [{"name": k, **v} for k, v in sorted(catalog.items())]
+    return [{"name": k, **v} for k, v in catalog.items()]
 
 
 def remove_dataset(name: str) -> None:
-    catalog = _load_catalog()
+    catalog = dict(_load_catalog())
     if name in catalog:
         del catalog[name]
         _save_catalog(catalog)
@@ -69,6 +153,30 @@ def remove_dataset(name: str) -> None:
         raise KeyError(f"No dataset named '{name}'")
 
 
+def _read_sqlite(path: str, query: str) -> pd.DataFrame:
+    """
+    Run `query` against a SQLite file. connectorx decodes rows into Arrow columns in
+    Rust, skipping sqlite3's per-row tuples, but it requires every value to match its
+    column's declared type; SQLite's dynamic typing allows otherwise, so on a decode
+    error the query is re-run through sqlite3 and pandas.
+    """
+    import connectorx as cx
+    import pandas as pd
+
+    # connectorx percent-decodes the URI, so the path must be quoted.
+    uri = "sqlite://" + urllib.parse.quote(path)
+    try:
+        return cx.read_sql(uri, query, return_type="arrow").to_pandas(split_blocks=True, self_destruct=True)
+    except RuntimeError:
+        import sqlite3
+
+        con = sqlite3.connect(path)
+        try:
+            return pd.read_sql(query, con)
+        finally:
+            con.close()
+
+
 def load_df(name: str, table: Optional[str] = None, limit: Optional[int] = None) -> pd.DataFrame:
     """
     Materialize a dataset into a pandas DataFrame.
@@ -80,62 +188,324 @@ def load_df(name: str, table: Optional[str] = None, limit: Optional[int] = None)
     fmt = entry["format"]
     path = entry["path"]
 
-    if fmt == "csv":
-        df = pd.read_csv(path)
-        return df.head(limit) if limit else df
-
-    if fmt == "parquet":
-        df = pd.read_parquet(path)
-        return df.head(limit) if limit else df
+    if fmt in {"csv", "parquet"}:
+        # DuckDB stops reading once LIMIT rows are produced, unlike pandas' readers.
+        reader = "read_csv_auto" if fmt == "csv" else "read_parquet"
+        q = f"SELECT * FROM {reader}(?)"
+        if limit:
+            q += f" LIMIT {int(limit)}"
+        return _preview_con().execute(q, [path]).df()
 
     if fmt in {"sqlite", "db"}:
-        import sqlite3
-        con = sqlite3.connect(path)
-        try:
-            if table is None:
-                tables = pd.read_sql("SELECT name FROM sqlite_master WHERE type='table' ORDER BY name;", con)["name"].tolist()
-                if not tables:
-                    raise ValueError(f"No tables found in SQLite DB: {path}")
-                table = tables[0]
-            q = f"SELECT * FROM {table}"
-            if limit:
-                q += f" LIMIT {int(limit)}"
-            return pd.read_sql(q, con)
-        finally:
-            con.close()
+        if table is None:
+            tables = _read_sqlite(path, "SELECT name FROM sqlite_master WHERE type='table' ORDER BY name;")
+            if tables.empty:
+                raise ValueError(f"No tables found in SQLite DB: {path}")
+            table = tables["name"].iloc[0]
+        q = f"SELECT * FROM {table}"
+        if limit:
+            q += f" LIMIT {int(limit)}"
+        return _read_sqlite(path, q)
 
     raise ValueError(f"Unsupported format: {fmt}")
 
 
-def run_sql(sql: str, register: Optional[Dict[str, str]] = None) -> pd.DataFrame:
+_CON: Optional[duckdb.DuckDBPyConnection] = None
+_CATALOG_MTIME: Optional[tuple] = None
+# Query-facing relation name -> catalog entry, and its lowercased-name index, for _CON.
+_RELATIONS: Dict[str, dict] = {}
+_RELATION_INDEX: Dict[str, str] = {}
+# relation name -> "table" | "view" | "attach" for everything registered on _CON so far.
+_REGISTERED: Dict[str, str] = {}
+# path -> stamp for every file copied into a table; the copy is stale once the file changes.
+_MATERIALIZED: Dict[str, Optional[tuple]] = {}
+
+# Identifiers (bare or double-quoted) and string literals, which are skipped.
+# Compiled once; tokenizing is a single pass over the SQL whatever the catalog size.
+_IDENT_RE = re.compile(r"'(?:[^']|'')*'|\"((?:[^\"]|\"\")+)\"|([^\W\d]\w*)")
+_WHERE_RE = re.compile(r"\bWHERE\b", re.IGNORECASE)
+
+
+def _file_stamp(path: str) -> Optional[tuple]:
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def _catalog_key(register: Optional[Dict[str, str]] = None, materialize: bool = True) -> tuple:
+    """Identify the on-disk catalog state (plus any options) a connection was built from."""
+    path = CATALOG_FILE.resolve()
+    aliases = tuple(sorted(register.items())) if register else ()
+    return (str(path), _file_stamp(str(path)), aliases, materialize)
+
+
+def _relations(catalog: Dict[str, dict], register: Optional[Dict[str, str]] = None) -> Dict[str, dict]:
+    """Map the name each dataset is queried by (alias, or `s_<name>` for SQLite) to its entry."""
+    relations = {}
+    for ds_name, meta in catalog.items():
+        if meta["format"] in {"sqlite", "db"}:
+            relations[f"s_{ds_name}"] = meta
+        elif register and register.get(ds_name):
+            relations[register[ds_name]] = meta
+        else:
+            relations[ds_name] = meta
+    return relations
+
+
+def _referenced_names(sql: str, index: Dict[str, str]) -> set:
     """
-    Execute SQL over local files via DuckDB.
-    `register`: mapping of logical name -> optional table alias.
-    All cataloged datasets are auto-attachable using DuckDB's 'read_csv'/'read_parquet' functions,
-    but here we materialize them into DuckDB temp views for convenience.
+    Return the relation names from `index` (lowercased name -> name) that appear
+    as identifiers in `sql`. The index is built once per connection, so the cost
+    per query is one regex pass plus a set intersection.
+    """
+    idents = {(quoted.replace('""', '"') if quoted else bare).lower() for quoted, bare in _IDENT_RE.findall(sql)}
+    return {index[i] for i in idents & index.keys()}
+
+
+def _relation_kind(meta: dict, materialize: bool, has_predicate: bool) -> str:
+    """
+    Choose how to expose a dataset for one query.
+    Small files are copied into a table when `materialize` is set, except Parquet
+    queried with a predicate, which stays a view so DuckDB can prune row groups.
+    """
+    fmt = meta["format"]
+    if fmt in {"sqlite", "db"}:
+        return "attach"
+    if fmt not in {"csv", "parquet"}:
+        raise ValueError(f"Unsupported format in catalog: {fmt}")
+    if not materialize or os.path.getsize(meta["path"]) >= SMALL_FILE_BYTES:
+        return "view"
+    if fmt == "parquet" and has_predicate:
+        return "view"
+    return "table"
+
+
+def _register_views(
+    con: duckdb.DuckDBPyConnection,
+    sql: str,
+    materialize: bool = True,
+    names: Optional[set] = None,
+) -> None:
+    """
+    Register on `con` the datasets `sql` references (or exactly `names`, if given).
+    A dataset first exposed as a view is upgraded to a table when a later query
+    scans it in full; tables are never downgraded.
+    """
+    has_predicate = bool(_WHERE_RE.search(sql))
+    if names is None:
+        names = _referenced_names(sql, _RELATION_INDEX)
+    for name in sorted(names):
+        meta = _RELATIONS[name]
+        kind = _relation_kind(meta, materialize, has_predicate)
+        current = _REGISTERED.get(name)
+        if current == kind or current == "table":
+            continue
+        path = meta["path"]
+        # Paths are bound as parameters so the statement text stays constant per reader.
+        reader = "read_csv_auto" if meta["format"] == "csv" else "read_parquet"
+        if kind == "attach":
+            # ATTACH cannot be prepared, so the path is escaped instead.
+            con.execute(f"ATTACH IF NOT EXISTS {_quote_literal(path)} AS {_quote_ident(name)} (TYPE SQLITE)")
+        elif kind == "table":
+            if current == "view":
+                con.execute(f"DROP VIEW {_quote_ident(name)}")
+            con.execute(f"CREATE OR REPLACE TABLE {_quote_ident(name)} AS SELECT * FROM {reader}(?)", [path])
+            _MATERIALIZED[path] = _file_stamp(path)
+        else:
+            con.sql(f"SELECT * FROM {reader}(?)", params=[path]).to_view(name, replace=True)
+        _REGISTERED[name] = kind
+
+
+def _make_connection() -> duckdb.DuckDBPyConnection:
     """
+    Open the in-memory DuckDB connection used for queries and previews.
+    Threads follow the CPU count; DATAPULSE_MEMORY_LIMIT (e.g. "8GB") overrides DuckDB's default of 80% of RAM.
+    The object and external file caches keep Parquet metadata and data warm across
+    queries on the cached connection.
+    """
+    import duckdb
+
+    config = {
+        "threads": os.cpu_count() or 1,
+        "enable_object_cache": True,
+        "enable_external_file_cache": True,
+    }
+    memory_limit = os.environ.get("DATAPULSE_MEMORY_LIMIT")
+    if memory_limit:
+        config["memory_limit"] = memory_limit
+    return duckdb.connect(database=":memory:", config=config)
+
+
+def _get_con(register: Optional[Dict[str, str]] = None, materialize: bool = True) -> duckdb.DuckDBPyConnection:
+    """
+    Return a cached in-memory DuckDB connection for the current catalog.
+    The connection is rebuilt only when the catalog file (or a materialized data
+    file) changes, so repeated queries keep DuckDB's caches warm.
+    """
+    global _CON, _CATALOG_MTIME, _RELATIONS, _RELATION_INDEX
+    key = _catalog_key(register, materialize)
+    if (
+        _CON is not None
+        and _CATALOG_MTIME == key
+        and all(_file_stamp(p) == stamp for p, stamp in _MATERIALIZED.items())
+    ):
+        return _CON
+    close()
+    _RELATIONS = _relations(_load_catalog(), register)
+    _RELATION_INDEX = {name.lower(): name for name in _RELATIONS}
+    _CON, _CATALOG_MTIME = _make_connection(), key
+    return _CON
+
+
+def _preview_con() -> duckdb.DuckDBPyConnection:
+    """
+    Return a connection for `load_df` previews. Previews bind the file path directly
+    and need no catalog registrations, so any cached connection will do; reusing it
+    keeps a `run_sql` connection built with other options from being torn down.
+    """
+    return _CON if _CON is not None else _get_con()
+
+
+def close() -> None:
+    """Close the cached DuckDB connection, if any."""
+    global _CON, _CATALOG_MTIME, _RELATIONS, _RELATION_INDEX
+    if _CON is not None:
+        _CON.close()
+    _CON = None
+    _CATALOG_MTIME = None
+    _RELATIONS = {}
+    _RELATION_INDEX = {}
+    _REGISTERED.clear()
+    _MATERIALIZED.clear()
+
 
-    con = duckdb.connect(database=":memory:")
+def _prune_registered(con: duckdb.DuckDBPyConnection) -> None:
+    """Forget registrations whose table, view or attached database is gone from `con`."""
+    existing = {
+        row[0].lower()
+        for row in con.execute(
+            "SELECT table_name FROM duckdb_tables()"
+            " UNION ALL SELECT view_name FROM duckdb_views() WHERE NOT internal"
+            " UNION ALL SELECT database_name FROM duckdb_databases()"
+        ).fetchall()
+    }
+    for name in [n for n in _REGISTERED if n.lower() not in existing]:
+        del _REGISTERED[name]
+
+
+def _execute(con: duckdb.DuckDBPyConnection, sql: str, materialize: bool, run):
+    """
+    Register the datasets `sql` names, then call `run()`.
+    Identifier scanning cannot see datasets named only indirectly (e.g. inside
+    `query_table('name')`), and user SQL on the shared connection may have dropped
+    a registered relation. So on a CatalogException, registrations that no longer
+    exist are forgotten, every dataset is registered, and `run()` is retried once.
+    """
+    import duckdb
+
+    _register_views(con, sql, materialize)
     try:
-        catalog = _load_catalog()
-
-        for ds_name, meta in catalog.items():
-            view_name = ds_name
-            if register and ds_name in register and register[ds_name]:
-                view_name = register[ds_name]
-            path = meta["path"]
-            fmt = meta["format"]
-            if fmt == "csv":
-                con.execute(f"CREATE VIEW {_quote_ident(view_name)} AS SELECT * FROM read_csv_auto('{path}')")
-            elif fmt == "parquet":
-                con.execute(f"CREATE VIEW {_quote_ident(view_name)} AS SELECT * FROM read_parquet('{path}')")
-            elif fmt in {"sqlite", "db"}:
-                schema = f"s_{ds_name}"
-                con.execute(f"ATTACH '{path}' AS {_quote_ident(schema)} (TYPE SQLITE)")
-            else:
-                raise ValueError(f"Unsupported format in catalog: {fmt}")
-
-        return con.execute(sql).df()
-    finally:
-        con.close()
+        return run()
+    except duckdb.CatalogException:
+        _prune_registered(con)
+        before = dict(_REGISTERED)
+        _register_views(con, sql, materialize, names=set(_RELATIONS))
+        if _REGISTERED == before:
+            raise
+        return run()
+
+
+def run_sql_arrow(sql: str, register: Optional[Dict[str, str]] = None, materialize: bool = True) -> pa.Table:
+    """
+    Execute SQL over local files via DuckDB and return the result as an Arrow table.
+    `register`: mapping of logical name -> optional table alias.
+    `materialize`: load small CSV/Parquet files into tables instead of views.
+    Only the cataloged datasets the query references are registered, as DuckDB
+    views or tables depending on file size and query shape (see `_relation_kind`);
+    if the query then fails to find a table, all datasets are registered and it is
+    retried (see `_execute`). Catalog listings such as `SHOW TABLES` therefore only
+    show datasets registered so far.
+    The connection and its registrations are cached between calls; see `_get_con`.
+    """
+    import pyarrow as pa
+
+    con = _get_con(register, materialize)
+    result = _execute(con, sql, materialize, lambda: con.execute(sql).arrow())
+    # DuckDB >= 1.4 returns a RecordBatchReader rather than a Table here.
+    if isinstance(result, pa.RecordBatchReader):
+        result = result.read_all()
+    return result
+
+
+def sql_relation(
+    sql: str, register: Optional[Dict[str, str]] = None, materialize: bool = True
+) -> Optional[duckdb.DuckDBPyRelation]:
+    """
+    Like `run_sql_arrow`, but return the lazy DuckDB relation so callers fetch only
+    the rows they need. Statements that produce no result (DDL, DROP, ...) are
+    executed immediately and return None.
+    """
+    con = _get_con(register, materialize)
+    return _execute(con, sql, materialize, lambda: con.sql(sql))
+
+
+def run_sql(sql: str, register: Optional[Dict[str, str]] = None, materialize: bool = True) -> pd.DataFrame:
+    """
+    Execute SQL over local files via DuckDB and return a pandas DataFrame.
+    See `run_sql_arrow`; the Arrow buffers are handed to pandas without consolidating blocks.
+    """
+    return run_sql_arrow(sql, register, materialize).to_pandas(split_blocks=True, self_destruct=True)
+
 
+def render_table(data, max_rows: int = 20, title: Optional[str] = None) -> Table:
+    """
+    Build a Rich table from at most `max_rows` rows of a pyarrow Table, pandas
+    DataFrame or DuckDB relation. Only the displayed rows are ever formatted,
+    whatever the size of the result, and a relation only fetches one row past
+    them; DataFrames are read as-is rather than converted to Arrow, so
+    mixed-type object columns render too.
+    """
+    import pyarrow as pa
+    from rich.table import Table
+
+    total = None
+    more = False
+    if isinstance(data, pa.Table):
+        total = data.num_rows
+        data = data.slice(0, max_rows)
+    elif hasattr(data, "limit"):  # DuckDB relation
+        data = data.limit(max_rows + 1).arrow()
+        if isinstance(data, pa.RecordBatchReader):
+            data = data.read_all()
+        more = data.num_rows > max_rows
+        data = data.slice(0, max_rows)
+
+    if isinstance(data, pa.Table):
+        shown = data.num_rows
+        columns = [
+            (field.name, pa.types.is_integer(field.type) or pa.types.is_floating(field.type) or pa.types.is_decimal(field.type))
+            for field in data.schema
+        ]
+        rows = zip(*(col.to_pylist() for col in data.columns))
+    else:  # pandas DataFrame
+        total = len(data)
+        head = data.head(max_rows)
+        shown = len(head)
+        columns = [(name, dtype.kind in "iufc") for name, dtype in head.dtypes.items()]
+        # Normalize NaN/NaT/pd.NA to None so they render like Arrow nulls.
+        rows = head.astype(object).where(head.notna(), None).itertuples(index=False, name=None)
+
+    if more:
+        caption = f"first {shown} rows"
+    elif total is not None and total > shown:
+        caption = f"{shown} of {total} rows"
+    else:
+        caption = None
+    table = Table(title=title, caption=caption)
+    for name, numeric in columns:
+        table.add_column(str(name), justify="right" if numeric else "left")
+    for row in rows:
+        table.add_row(*("NULL" if v is None else str(v) for v in row))
+    return table
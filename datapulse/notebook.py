@@ -1,36 +1,29 @@
 from __future__ import annotations
-import json
 import pathlib
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from typing import List, Sequence
 
 import nbformat as nbf
+import orjson
 
 CATALOG_DIR = pathlib.Path(".datapulse")
 CATALOG_FILE = CATALOG_DIR / "catalog.json"
 
 
-def _load_catalog() -> dict:
-    if not CATALOG_FILE.exists():
-        return {}
-    return json.loads(CATALOG_FILE.read_text(encoding="utf-8"))
-
-def _mk_markdown_cell(sql: str) -> nbf.NotebookNode:
-    ts = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    md = f"""# DataPulse Analysis
+# Cell sources are built once at import; only the markdown and SQL cells are templated.
+_MARKDOWN_TEMPLATE = """# DataPulse Analysis
 
 **Generated:** {ts}
 
 **Query**
 ```sql
-{sql.strip()}
+{sql}
 ```
 This notebook auto-registers your cataloged datasets as DuckDB views, executes the SQL, and renders a quick preview + plot.
 """
-    return nbf.v4.new_markdown_cell(md)
 
-
-def _mk_setup_cell() -> nbf.NotebookNode:
-    code = r"""import json, os, pathlib
+_SETUP_CODE = r"""import json, os, pathlib
 import duckdb, pandas as pd
 from IPython.display import display
 
@@ -53,82 +46,127 @@ CATALOG_FILE = CATALOG_DIR / "catalog.json"
 def _quote_ident(name: str) -> str:
     return '"' + name.replace('"', '""') + '"'
 
+def _quote_literal(value: str) -> str:
+    # ATTACH cannot take a bound parameter, so escape the path as a SQL string.
+    return "'" + value.replace("'", "''") + "'"
+
 def register_catalog(con: duckdb.DuckDBPyConnection):
     if not CATALOG_FILE.exists():
         print("No catalog found (.datapulse/catalog.json). Add datasets with `datapulse add ...`")
         return
     catalog = json.loads(CATALOG_FILE.read_text(encoding="utf-8"))
-    for ds_name, meta in catalog.items():
+    if isinstance(catalog.get("entries"), list):
+        entries = catalog["entries"]
+    else:  # catalogs written before the sorted "entries" layout
+        entries = [{"name": k, **v} for k, v in catalog.items()]
+    for meta in entries:
+        ds_name = meta["name"]
         path = meta["path"]
         fmt = meta["format"]
         view_name = ds_name
         if fmt == "csv":
-            con.execute(f"CREATE OR REPLACE VIEW {_quote_ident(view_name)} AS SELECT * FROM read_csv_auto('{path}')")
+            con.sql("SELECT * FROM read_csv_auto(?)", params=[path]).to_view(view_name, replace=True)
         elif fmt == "parquet":
-            con.execute(f"CREATE OR REPLACE VIEW {_quote_ident(view_name)} AS SELECT * FROM read_parquet('{path}')")
+            con.sql("SELECT * FROM read_parquet(?)", params=[path]).to_view(view_name, replace=True)
         elif fmt in {"sqlite", "db"}:
             schema = f"s_{ds_name}"
-            con.execute(f"ATTACH '{path}' AS {_quote_ident(schema)} (TYPE SQLITE)")
+            con.execute(f"ATTACH {_quote_literal(path)} AS {_quote_ident(schema)} (TYPE SQLITE)")
         else:
             raise ValueError(f"Unsupported format in catalog: {fmt}")
 
-con = duckdb.connect(database=":memory:")
+def _connection_config() -> dict:
+    # Mirrors datapulse.engine._make_connection: memory-limit override, caches on.
+    config = {
+        "threads": os.cpu_count() or 1,
+        "enable_object_cache": True,
+        "enable_external_file_cache": True,
+    }
+    if os.environ.get("DATAPULSE_MEMORY_LIMIT"):
+        config["memory_limit"] = os.environ["DATAPULSE_MEMORY_LIMIT"]
+    return config
+
+con = duckdb.connect(database=":memory:", config=_connection_config())
 register_catalog(con)
 print("✅ DuckDB in-memory session ready; catalog views are registered.")
 """
-    return nbf.v4.new_code_cell(code)
 
+_SQL_TEMPLATE = '''# Your SQL (editable)
+sql = r"""{sql}"""'''
 
-def _mk_sql_cell(sql: str) -> nbf.NotebookNode:
-    code = f"""# Your SQL (editable)
-sql = r\"\"\"{sql.strip()}\"\"\""""
-    return nbf.v4.new_code_cell(code)
-
+_EXECUTE_CODE = r"""# Execute query once into an in-memory table, then preview, count and export from it
+import pathlib
 
-def _mk_execute_cell() -> nbf.NotebookNode:
-    code = r"""# Execute query and show results
-df = con.execute(sql).df()
-print("Rows:", len(df))
-display(df.head(10))
+con.execute("DROP TABLE IF EXISTS last_result")
+con.sql(sql).to_table("last_result")
+result = con.table("last_result")
+print("Rows:", result.count("*").fetchone()[0])
+preview = result.limit(10).df()
+display(preview)
 
-# Persist latest result for quick export
-import pathlib
+# Persist latest result for quick export (DuckDB's native, parallel CSV writer)
 out_dir = pathlib.Path("notebooks")
 out_dir.mkdir(parents=True, exist_ok=True)
-df.to_csv(out_dir / "last_result.csv", index=False)
+result.write_csv(str(out_dir / "last_result.csv"))
 print("Saved:", out_dir / "last_result.csv")"""
-    return nbf.v4.new_code_cell(code)
 
-
-def _mk_plot_cell() -> nbf.NotebookNode:
-    code = r"""# Try a quick plot (heuristic: use first categorical as x, first numeric as y)
+_PLOT_CODE = r"""# Try a quick plot (heuristic: use first categorical as x, first numeric as y)
 import pandas as pd
 import matplotlib.pyplot as plt
 
 def pick_columns_for_plot(dataframe: pd.DataFrame):
-    num_cols = [c for c in dataframe.columns if pd.api.types.is_numeric_dtype(dataframe[c])]
-    cat_cols = [c for c in dataframe.columns if not pd.api.types.is_numeric_dtype(dataframe[c])]
+    # Classify columns from the dtype kinds in one pass instead of probing each column.
+    kinds = dataframe.dtypes.apply(lambda d: d.kind)
+    num_cols = dataframe.columns[kinds.isin(list("biufc"))].tolist()
+    cat_cols = dataframe.columns[~kinds.isin(list("biufcmM"))].tolist()
     if num_cols and cat_cols:
         return cat_cols[0], num_cols[0]
     if len(num_cols) >= 2:
         return num_cols[0], num_cols[1]
-    if len(df.columns) >= 2:
-        return df.columns[0], df.columns[1]
+    if len(dataframe.columns) >= 2:
+        return dataframe.columns[0], dataframe.columns[1]
     return None, None
 
-x, y = pick_columns_for_plot(df)
+x, y = pick_columns_for_plot(preview)
 if x is not None and y is not None:
-    ax = df.groupby(x)[y].sum().plot(kind="bar", figsize=(8, 4))
+    # Aggregate in DuckDB so only one row per group reaches pandas.
+    qx, qy = _quote_ident(x), _quote_ident(y)
+    grouped = result.aggregate(f"{qx}, SUM({qy}) AS {qy}", qx).order(qx).df()
+    ax = grouped.set_index(x)[y].plot(kind="bar", figsize=(8, 4))
     ax.set_title(f"{y} by {x}")
     plt.tight_layout()
     plt.show()
 else:
     print("Not enough columns to auto-plot.")
 """
-    return nbf.v4.new_code_cell(code)
 
 
-def write_notebook_from_sql(sql: str, out_path: str = "notebooks/analysis.ipynb") -> pathlib.Path:
+def _load_catalog() -> dict:
+    from . import engine
+
+    return engine._load_catalog()
+
+def _mk_markdown_cell(sql: str) -> nbf.NotebookNode:
+    ts = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    return nbf.v4.new_markdown_cell(_MARKDOWN_TEMPLATE.format(ts=ts, sql=sql.strip()))
+
+
+def _mk_setup_cell() -> nbf.NotebookNode:
+    return nbf.v4.new_code_cell(_SETUP_CODE)
+
+
+def _mk_sql_cell(sql: str) -> nbf.NotebookNode:
+    return nbf.v4.new_code_cell(_SQL_TEMPLATE.format(sql=sql.strip()))
+
+
+def _mk_execute_cell() -> nbf.NotebookNode:
+    return nbf.v4.new_code_cell(_EXECUTE_CODE)
+
+
+def _mk_plot_cell() -> nbf.NotebookNode:
+    return nbf.v4.new_code_cell(_PLOT_CODE)
+
+
+def _render_notebook(sql: str) -> bytes:
     nb = nbf.v4.new_notebook()
     nb.cells = [
         _mk_markdown_cell(sql),
@@ -137,8 +175,30 @@ def write_notebook_from_sql(sql: str, out_path: str = "notebooks/analysis.ipynb"
         _mk_execute_cell(),
         _mk_plot_cell(),
     ]
+    # orjson's serializer is much faster than nbformat's stdlib json path; the
+    # cells come from nbformat's own constructors, so validation is skipped.
+    return orjson.dumps(nb, option=orjson.OPT_INDENT_2 | orjson.OPT_SORT_KEYS) + b"\n"
+
+
+def write_notebook_from_sql(sql: str, out_path: str = "notebooks/analysis.ipynb") -> pathlib.Path:
     out = pathlib.Path(out_path)
     out.parent.mkdir(parents=True, exist_ok=True)
-    nbf.write(nb, str(out))
+    out.write_bytes(_render_notebook(sql))
     return out
 
+
+def write_notebooks_from_sqls(sqls: Sequence[str], out_paths: Sequence[str]) -> List[pathlib.Path]:
+    """
+    Generate one notebook per SQL query, e.g. when regenerating a set of dashboards.
+    Every notebook is rendered in memory first, then the files are written
+    concurrently with one buffered write each.
+    """
+    if len(sqls) != len(out_paths):
+        raise ValueError(f"Got {len(sqls)} queries but {len(out_paths)} output paths")
+    outs = [pathlib.Path(p) for p in out_paths]
+    payloads = [_render_notebook(sql) for sql in sqls]
+    for parent in {out.parent for out in outs}:
+        parent.mkdir(parents=True, exist_ok=True)
+    with ThreadPoolExecutor() as pool:
+        list(pool.map(pathlib.Path.write_bytes, outs, payloads))
+    return outs
@@ -1,3 +1,8 @@
+import json
+import os
+
+import pytest
+
 from datapulse import engine
 
 def test_catalog_roundtrip(tmp_path, monkeypatch):
@@ -13,3 +18,302 @@ def test_catalog_roundtrip(tmp_path, monkeypatch):
     assert list(df.columns) == ["a", "b"]
     out = engine.run_sql("SELECT COUNT(*) AS n FROM t")
     assert int(out.iloc[0]["n"]) == 1
+
+
+def test_run_sql_reuses_connection_until_catalog_changes(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "a.csv").write_text("x\n1\n2\n", encoding="utf-8")
+    (tmp_path / "b.csv").write_text("y\n3\n", encoding="utf-8")
+
+    engine.add_dataset("a", str(tmp_path / "a.csv"))
+    try:
+        assert int(engine.run_sql("SELECT COUNT(*) AS n FROM a").iloc[0]["n"]) == 2
+        con = engine._get_con()
+        engine.run_sql("SELECT 1")
+        assert engine._get_con() is con
+
+        engine.add_dataset("b", str(tmp_path / "b.csv"))
+        assert int(engine.run_sql("SELECT COUNT(*) AS n FROM b").iloc[0]["n"]) == 1
+    finally:
+        engine.close()
+
+
+def test_small_files_materialize_as_tables(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "a.csv").write_text("x\n1\n", encoding="utf-8")
+    engine.add_dataset("a", str(tmp_path / "a.csv"))
+    q = "SELECT table_type, (SELECT COUNT(*) FROM a) AS n FROM information_schema.tables WHERE table_name = 'a'"
+    try:
+        assert engine.run_sql(q).iloc[0]["table_type"] == "BASE TABLE"
+        assert engine.run_sql(q, materialize=False).iloc[0]["table_type"] == "VIEW"
+    finally:
+        engine.close()
+
+
+def test_only_referenced_datasets_are_registered(tmp_path, monkeypatch):
+    import duckdb
+
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "a.csv").write_text("x\n1\n", encoding="utf-8")
+    duckdb.sql(f"COPY (SELECT 1 AS y) TO '{tmp_path / 'p.parquet'}' (FORMAT PARQUET)")
+    engine.add_dataset("a", str(tmp_path / "a.csv"))
+    engine.add_dataset("p", str(tmp_path / "p.parquet"))
+    kinds = "SELECT table_name, table_type FROM information_schema.tables"
+    try:
+        engine.run_sql("SELECT * FROM p WHERE y = 1")
+        assert engine._REGISTERED == {"p": "view"}
+        engine.run_sql("SELECT * FROM p")
+        assert engine._REGISTERED == {"p": "table"}
+        out = engine.run_sql(kinds + " WHERE table_name = 'a'")
+        assert out.empty
+    finally:
+        engine.close()
+
+
+def test_load_df_sqlite_defaults_to_first_table(tmp_path, monkeypatch):
+    import sqlite3
+
+    monkeypatch.chdir(tmp_path)
+    db = tmp_path / "app.db"
+    con = sqlite3.connect(db)
+    con.execute("CREATE TABLE users (id INTEGER, name TEXT)")
+    con.executemany("INSERT INTO users VALUES (?, ?)", [(1, "ada"), (2, "bob")])
+    con.commit()
+    con.close()
+
+    engine.add_dataset("app", str(db))
+    df = engine.load_df("app", limit=1)
+    assert list(df.columns) == ["id", "name"]
+    assert len(df) == 1
+
+
+def test_readding_same_dataset_does_not_rewrite_catalog(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "a.csv").write_text("x\n1\n", encoding="utf-8")
+    engine.add_dataset("a", str(tmp_path / "a.csv"))
+    os.utime(engine.CATALOG_FILE, ns=(0, 0))
+    engine.add_dataset("a", str(tmp_path / "a.csv"))
+    assert engine.CATALOG_FILE.stat().st_mtime_ns == 0
+
+
+def test_load_catalog_reuses_parse_until_file_changes(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "a.csv").write_text("x\n1\n", encoding="utf-8")
+    engine.add_dataset("a", str(tmp_path / "a.csv"))
+    first = engine._load_catalog()
+    assert engine._load_catalog() is first
+
+    engine.CATALOG_FILE.write_text('{"b": {"path": "b.csv", "format": "csv"}}', encoding="utf-8")
+    assert list(engine._load_catalog()) == ["b"]
+
+
+def test_run_sql_handles_quotes_in_paths(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    csv = tmp_path / "o'brien.csv"
+    csv.write_text("x\n1\n2\n", encoding="utf-8")
+    engine.add_dataset("ob", str(csv))
+    try:
+        for materialize in (True, False):
+            out = engine.run_sql("SELECT COUNT(*) AS n FROM ob", materialize=materialize)
+            assert int(out.iloc[0]["n"]) == 2
+    finally:
+        engine.close()
+
+
+def test_connection_honors_env_settings(monkeypatch):
+    monkeypatch.setenv("DATAPULSE_MEMORY_LIMIT", "1GB")
+    con = engine._make_connection()
+    try:
+        threads, memory = con.execute(
+            "SELECT current_setting('threads'), current_setting('memory_limit')"
+        ).fetchone()
+        assert int(threads) == (os.cpu_count() or 1)
+        assert memory.startswith("953")
+    finally:
+        con.close()
+
+
+def test_catalog_entries_stay_sorted_and_old_layout_migrates(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    for n in ("b", "a", "c"):
+        (tmp_path / f"{n}.csv").write_text("x\n1\n", encoding="utf-8")
+    engine._ensure_catalog_dir()
+    engine.CATALOG_FILE.write_text(
+        json.dumps({"b": {"path": str(tmp_path / "b.csv"), "format": "csv"}}), encoding="utf-8"
+    )
+    engine.add_dataset("c", str(tmp_path / "c.csv"))
+    engine.add_dataset("a", str(tmp_path / "a.csv"))
+
+    assert [r["name"] for r in engine.list_datasets()] == ["a", "b", "c"]
+    on_disk = json.loads(engine.CATALOG_FILE.read_text(encoding="utf-8"))
+    assert [e["name"] for e in on_disk["entries"]] == ["a", "b", "c"]
+
+
+def test_referenced_names_skips_literals_and_ignores_case():
+    index = {"sales": "Sales", "my-data": "my-data", "other": "other"}
+    sql = """SELECT * FROM SALES JOIN "my-data" USING (id) WHERE note = 'other'"""
+    assert engine._referenced_names(sql, index) == {"Sales", "my-data"}
+
+
+def test_render_table_bounds_rows():
+    import pandas as pd
+
+    table = engine.render_table(pd.DataFrame({"a": range(50), "b": ["x"] * 50}), max_rows=3)
+    assert table.row_count == 3
+    assert [c.header for c in table.columns] == ["a", "b"]
+    assert table.caption == "3 of 50 rows"
+
+
+def test_parquet_view_and_table_have_identical_types(tmp_path, monkeypatch):
+    import duckdb
+
+    monkeypatch.chdir(tmp_path)
+    pq = tmp_path / "typed.parquet"
+    duckdb.sql(
+        f"COPY (SELECT uuid() AS u, INTERVAL 3 DAY AS iv, 1 AS k) TO '{pq}' (FORMAT PARQUET)"
+    )
+    engine.add_dataset("p", str(pq))
+    types = "SELECT typeof(u) AS u, typeof(iv) AS iv, typeof(k) AS k FROM p"
+    try:
+        as_view = engine.run_sql(types + " WHERE 1=1").iloc[0].to_dict()
+        assert engine._REGISTERED == {"p": "view"}
+        as_table = engine.run_sql(types).iloc[0].to_dict()
+        assert engine._REGISTERED == {"p": "table"}
+        assert as_view == as_table == {"u": "UUID", "iv": "INTERVAL", "k": "INTEGER"}
+    finally:
+        engine.close()
+
+
+def test_add_datasets_writes_once_and_atomically(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    for n in ("b", "a"):
+        (tmp_path / f"{n}.csv").write_text("x\n1\n", encoding="utf-8")
+    saves = []
+    real_save = engine._save_catalog
+    monkeypatch.setattr(engine, "_save_catalog", lambda c: (saves.append(c), real_save(c)))
+
+    engine.add_datasets([("b", str(tmp_path / "b.csv")), ("a", str(tmp_path / "a.csv"))])
+    assert len(saves) == 1
+    assert [r["name"] for r in engine.list_datasets()] == ["a", "b"]
+    assert not (tmp_path / ".datapulse" / "catalog.json.tmp").exists()
+
+    with pytest.raises(FileNotFoundError):
+        engine.add_datasets([("c", str(tmp_path / "missing.csv"))])
+    assert len(saves) == 1
+
+
+def test_load_df_keeps_query_connection(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "a.csv").write_text("x\n1\n", encoding="utf-8")
+    engine.add_dataset("a", str(tmp_path / "a.csv"))
+    try:
+        engine.run_sql("SELECT * FROM a", materialize=False)
+        con = engine._get_con(materialize=False)
+        assert len(engine.load_df("a", limit=1)) == 1
+        assert engine._get_con(materialize=False) is con
+        assert engine._REGISTERED == {"a": "view"}
+    finally:
+        engine.close()
+
+
+def test_load_df_sqlite_falls_back_on_mixed_types(tmp_path, monkeypatch):
+    import sqlite3
+
+    monkeypatch.chdir(tmp_path)
+    db = tmp_path / "loose.db"
+    con = sqlite3.connect(db)
+    con.execute("CREATE TABLE t (a INTEGER, b, d DATETIME, n NUMERIC)")
+    con.execute("INSERT INTO t VALUES (1, 'x', '2024-01-01', 1)")
+    con.execute("INSERT INTO t VALUES ('hello', 2, 'soon', 'lots')")
+    con.commit()
+    con.close()
+
+    engine.add_dataset("loose", str(db))
+    df = engine.load_df("loose")
+    assert list(df["a"]) == [1, "hello"]
+    assert list(df["d"]) == ["2024-01-01", "soon"]
+
+
+def test_load_df_sqlite_path_with_percent_escape(tmp_path, monkeypatch):
+    import sqlite3
+
+    monkeypatch.chdir(tmp_path)
+    db = tmp_path / "pct%20x.db"
+    con = sqlite3.connect(db)
+    con.execute("CREATE TABLE t (a INTEGER)")
+    con.execute("INSERT INTO t VALUES (1)")
+    con.commit()
+    con.close()
+
+    engine.add_dataset("pct", str(db))
+    assert list(engine.load_df("pct")["a"]) == [1]
+    assert not (tmp_path / "pct x.db").exists()
+
+
+def test_render_table_handles_mixed_object_columns():
+    import pandas as pd
+
+    df = pd.DataFrame({"a": [1, "hello", None], "n": pd.array([1, None, 3], dtype="Int64")})
+    table = engine.render_table(df)
+    assert table.row_count == 3
+    assert list(table.columns[0].cells) == ["1", "hello", "NULL"]
+    assert list(table.columns[1].cells) == ["1", "NULL", "3"]
+
+
+def test_head_rejects_non_positive_limit(tmp_path, monkeypatch):
+    from click.testing import CliRunner
+
+    from datapulse.cli import cli
+
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "a.csv").write_text("x\n1\n", encoding="utf-8")
+    engine.add_dataset("a", str(tmp_path / "a.csv"))
+    result = CliRunner().invoke(cli, ["head", "a", "--limit", "0"])
+    assert result.exit_code == 2
+    assert "--limit" in result.output
+
+
+def test_run_sql_resolves_unicode_and_indirect_references(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "v.csv").write_text("x\n1\n2\n", encoding="utf-8")
+    engine.add_dataset("ventes_é", str(tmp_path / "v.csv"))
+    try:
+        assert len(engine.run_sql("SELECT * FROM ventes_é")) == 2
+        engine.close()
+        out = engine.run_sql("SELECT COUNT(*) AS n FROM query_table('ventes_é')")
+        assert int(out.iloc[0]["n"]) == 2
+    finally:
+        engine.close()
+
+
+def test_run_sql_reregisters_dataset_dropped_by_user_sql(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "y.csv").write_text("x\n1\n", encoding="utf-8")
+    engine.add_dataset("y", str(tmp_path / "y.csv"))
+    try:
+        for materialize, drop in ((True, "DROP TABLE y"), (False, "DROP VIEW y")):
+            assert len(engine.run_sql("SELECT * FROM y", materialize=materialize)) == 1
+            engine.run_sql(drop, materialize=materialize)
+            assert len(engine.run_sql("SELECT * FROM y", materialize=materialize)) == 1
+    finally:
+        engine.close()
+
+
+def test_sql_cli_shows_bounded_result_and_rejects_non_positive_max_rows(tmp_path, monkeypatch):
+    from click.testing import CliRunner
+
+    from datapulse.cli import cli
+
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "a.csv").write_text("x\n" + "".join(f"{i}\n" for i in range(50)), encoding="utf-8")
+    engine.add_dataset("a", str(tmp_path / "a.csv"))
+    try:
+        result = CliRunner().invoke(cli, ["sql", "SELECT * FROM a", "--max-rows", "3"])
+        assert result.exit_code == 0
+        assert "│ 2 │" in result.output and "│ 3 │" not in result.output
+        assert engine.render_table(engine.sql_relation("SELECT * FROM a"), max_rows=3).caption == "first 3 rows"
+        result = CliRunner().invoke(cli, ["sql", "SELECT * FROM a", "--max-rows", "0"])
+        assert result.exit_code == 2
+        assert "--max-rows" in result.output
+    finally:
+        engine.close()
@@ -0,0 +1,36 @@
+import nbformat
+
+from datapulse import notebook
+
+
+def test_notebook_is_valid_nbformat(tmp_path):
+    out = notebook.write_notebook_from_sql("SELECT 1 AS n", out_path=str(tmp_path / "nb" / "a.ipynb"))
+    nb = nbformat.read(str(out), as_version=4)
+    nbformat.validate(nb)
+    assert len(nb.cells) == 5
+    assert "SELECT 1 AS n" in nb.cells[2].source
+
+
+def test_write_notebooks_from_sqls(tmp_path):
+    outs = notebook.write_notebooks_from_sqls(
+        ["SELECT 1", "SELECT 2"], [str(tmp_path / "a" / "one.ipynb"), str(tmp_path / "b" / "two.ipynb")]
+    )
+    assert [nbformat.read(str(o), as_version=4).cells[2].source.count("SELECT 2") for o in outs] == [0, 1]
+
+
+def test_setup_cell_registers_path_with_quote(tmp_path, monkeypatch):
+    import json
+
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "o'brien.csv").write_text("x\n1\n2\n", encoding="utf-8")
+    (tmp_path / ".datapulse").mkdir()
+    (tmp_path / ".datapulse" / "catalog.json").write_text(
+        json.dumps({"entries": [{"name": "c", "path": str(tmp_path / "o'brien.csv"), "format": "csv"}]}),
+        encoding="utf-8",
+    )
+    ns = {}
+    exec(notebook._SETUP_CODE, ns)
+    try:
+        assert ns["con"].execute("SELECT COUNT(*) FROM c").fetchone() == (2,)
+    finally:
+        ns["con"].close()